@@ -9,6 +9,10 @@ MODEL = "gpt-4o-transcribe"
 AUDIO_SAMPLE_RATE = 16000
 AUDIO_CHANNELS = 1
 MAX_RECORD_SECONDS = 60
+SILENCE_STOP_SECONDS = None  # e.g. 1.5 to stop after that much trailing silence, even with the key held
+DISCARD_SILENT_RECORDINGS = True  # don't upload recordings in which no speech was detected
+SILENCE_THRESHOLD = 0.01  # RMS level of a 20 ms frame, as a fraction of full scale, that counts as speech
+UPLOAD_FORMAT = "wav"  # "wav", or "opus"/"flac" to compress uploads for slow uplinks
 
 # Logging behaviour
 LOG_LEVEL = logging.INFO  # set to logging.WARNING to quiet most logs
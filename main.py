@@ -1,27 +1,42 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
+import io
 import logging
 import os
-import select
+import selectors
+import struct
 import subprocess
 import sys
-import tempfile
+import threading
 import time
-from pathlib import Path
-from typing import Dict, Iterable, Optional
+from typing import Optional, Tuple
 
 import evdev
+import httpx
 import numpy as np
 import sounddevice as sd
 from dotenv import load_dotenv
 from evdev import InputDevice, ecodes
-from openai import OpenAI
+from openai import DefaultHttpxClient, OpenAI
 
 import config
 from features import Features
 
 
+_LOG_LEVELS = {
+    "NOTSET": logging.NOTSET,
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARN": logging.WARN,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "FATAL": logging.FATAL,
+    "CRITICAL": logging.CRITICAL,
+}
+
+
 def configure_logging() -> None:
     handler = logging.StreamHandler(sys.stdout)
     log_format = getattr(config, "LOG_FORMAT", "%(levelname)s: %(message)s")
@@ -30,69 +45,219 @@ def configure_logging() -> None:
     root = logging.getLogger()
     level = getattr(config, "LOG_LEVEL", logging.INFO)
     if isinstance(level, str):
-        level = getattr(logging, level.upper(), logging.INFO)
+        level = _LOG_LEVELS.get(level.upper(), logging.INFO)
     root.setLevel(level)
     root.handlers.clear()
     root.addHandler(handler)
 
 
+def create_openai_client(api_key: str) -> OpenAI:
+    """Build an OpenAI client whose connection stays warm between utterances."""
+    # DefaultHttpxClient keeps the SDK's transport defaults (e.g. redirects).
+    http_client = DefaultHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300.0),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+    return OpenAI(api_key=api_key, http_client=http_client)
+
+
+# Canonical 44-byte RIFF/WAVE header for uncompressed 16-bit PCM.
+_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def _wav_header(data_size: int, sample_rate: int, channels: int) -> bytes:
+    block_align = channels * 2
+    return _WAV_HEADER.pack(
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+        b"data", data_size,
+    )
+
+
+# (file name, data, content type), the multipart form the OpenAI SDK accepts.
+AudioUpload = Tuple[str, io.BytesIO, str]
+
+# Compressed upload formats:
+# config name -> (libsndfile format, subtype, file name, content type).
+_UPLOAD_FORMATS = {
+    "opus": ("OGG", "OPUS", "audio.ogg", "audio/ogg"),
+    "flac": ("FLAC", "PCM_16", "audio.flac", "audio/flac"),
+}
+
+# Fixed callback period; bounds how much in-flight audio abort() can drop.
+_BLOCK_SECONDS = 0.02
+
+# How often captured audio is scanned for trailing silence while recording.
+_VAD_POLL_SECONDS = 0.1
+
+# Voice activity is judged on the RMS level of fixed frames; speech needs a run
+# of loud frames so that a click or key thump does not count.
+_VAD_FRAME_SECONDS = 0.02
+_MIN_SPEECH_SECONDS = 0.1
+
+# Audio kept after the last speech when a recording stops on trailing silence.
+_SPEECH_TAIL_SECONDS = 0.3
+
+
 class AudioRecorder:
-    def __init__(self, sample_rate: int, channels: int, max_seconds: int) -> None:
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+        max_seconds: int,
+        silence_seconds: Optional[float] = None,
+        silence_threshold: float = 0.01,
+        discard_silent: bool = False,
+    ) -> None:
         self.sample_rate = sample_rate
         self.channels = channels
         self.max_seconds = max_seconds
-        self._frames: list[np.ndarray] = []
-        self._stream: Optional[sd.InputStream] = None
+        self._silence_limit = int(silence_seconds * sample_rate) if silence_seconds else None
+        self._silence_threshold = silence_threshold * 32767
+        self._discard_silent = discard_silent
+        self._vad_frame = max(1, int(sample_rate * _VAD_FRAME_SECONDS))
+        self._min_speech_frames = round(_MIN_SPEECH_SECONDS / _VAD_FRAME_SECONDS)
+        self._speech_tail = int(sample_rate * _SPEECH_TAIL_SECONDS)
+        self._scanned = 0
+        self._voiced_run = 0
+        self._speech_seen = False
+        self._speech_end = 0
+        # Preallocated once so the realtime callback only copies into it.
+        # Captured as int16, the same PCM16 that ends up in the uploaded WAV.
+        self._buf = np.empty((max_seconds * sample_rate, channels), dtype=np.int16)
+        self._buf_bytes = memoryview(self._buf).cast("B")
+        self._frame_bytes = channels * self._buf.itemsize
+        self._pos = 0
+        self._status_flagged = False
+        self._stream: Optional[sd.RawInputStream] = None
         self._start_time: Optional[float] = None
+        self._deadline: Optional[float] = None
         self._logger = logging.getLogger(self.__class__.__name__)
 
     @property
     def recording(self) -> bool:
         return self._stream is not None
 
+    @property
+    def detects_silence(self) -> bool:
+        return self._silence_limit is not None
+
     def start(self) -> None:
         if self.recording:
             return
-        self._frames = []
-        self._start_time = time.time()
+        self._pos = 0
+        self._status_flagged = False
+        self._scanned = 0
+        self._voiced_run = 0
+        self._speech_seen = False
+        self._speech_end = 0
+        # Monotonic so wall-clock adjustments cannot cut a recording short.
+        self._start_time = time.monotonic()
+        self._deadline = self._start_time + self.max_seconds
 
         def callback(indata, frames, time_info, status) -> None:  # type: ignore[no-untyped-def]
+            # Runs on the PortAudio thread: no allocations, no logging.
             if status:
-                self._logger.warning("Audio stream status: %s", status)
-            self._frames.append(indata.copy())
-
-        self._stream = sd.InputStream(
+                self._status_flagged = True
+            # indata is a raw cffi buffer; copy its bytes straight into the
+            # preallocated array without wrapping it in an ndarray.
+            pos = self._pos
+            n = min(frames, len(self._buf) - pos)
+            if n < frames:
+                indata = memoryview(indata)[:n * self._frame_bytes]
+            start = pos * self._frame_bytes
+            self._buf_bytes[start:start + n * self._frame_bytes] = indata
+            self._pos = pos + n
+
+        self._stream = sd.RawInputStream(
             samplerate=self.sample_rate,
             channels=self.channels,
-            dtype="float32",
+            dtype="int16",
+            blocksize=int(self.sample_rate * _BLOCK_SECONDS),
             callback=callback,
         )
         self._stream.start()
         self._logger.info("Recording started.")
 
     def has_reached_max_duration(self) -> bool:
-        if not self.recording or self._start_time is None:
+        if not self.recording or self._deadline is None:
+            return False
+        return time.monotonic() >= self._deadline
+
+    def seconds_until_max_duration(self) -> Optional[float]:
+        if not self.recording or self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def has_trailing_silence(self) -> bool:
+        """Report whether speech was heard and has since been followed by silence."""
+        if not self.recording or self._silence_limit is None:
             return False
-        return (time.time() - self._start_time) >= self.max_seconds
+        self._scan_voice_activity()
+        return self._ended_in_silence()
+
+    def _ended_in_silence(self) -> bool:
+        if self._silence_limit is None or not self._speech_seen:
+            return False
+        return self._scanned - self._speech_end >= self._silence_limit
+
+    def _scan_voice_activity(self) -> None:
+        # RMS level of each whole frame captured since the last scan; done off
+        # the realtime thread so the callback stays a plain copy.
+        frame = self._vad_frame
+        start = self._scanned
+        end = start + (self._pos - start) // frame * frame
+        if end <= start:
+            return
+        block = self._buf[start:end].reshape(-1, frame * self.channels).astype(np.float32)
+        voiced = np.sqrt(np.mean(np.square(block), axis=1)) > self._silence_threshold
+        run = self._voiced_run
+        for i, is_voiced in enumerate(voiced):
+            if not is_voiced:
+                run = 0
+                continue
+            run += 1
+            if run >= self._min_speech_frames:
+                self._speech_seen = True
+                self._speech_end = start + (i + 1) * frame
+        self._voiced_run = run
+        self._scanned = end
 
     def stop(self) -> Optional[np.ndarray]:
+        """Stop recording and return a view of the captured audio.
+
+        The view is only valid until the next call to start().
+        """
         if not self.recording:
             return None
         if self._stream:
-            self._stream.stop()
-            self._stream.close()
+            # abort() returns without draining queued buffers; at most one
+            # block of trailing audio is lost, which is past the end of speech.
+            self._stream.abort(ignore_errors=True)
+            self._stream.close(ignore_errors=True)
         self._stream = None
         duration = 0.0
         if self._start_time is not None:
-            duration = time.time() - self._start_time
+            duration = time.monotonic() - self._start_time
         self._start_time = None
-        if not self._frames:
+        self._deadline = None
+        if self._status_flagged:
+            self._logger.warning("Audio stream reported input overflow or underflow.")
+        if not self._pos:
             self._logger.warning("No audio frames captured.")
             return None
-        audio = np.concatenate(self._frames, axis=0)
-        self._frames = []
+        if self._discard_silent:
+            self._scan_voice_activity()
+            if not self._speech_seen:
+                self._logger.info("No speech detected; discarding recording.")
+                return None
+        end = self._pos
+        if self._ended_in_silence():
+            # Don't upload the silence that ended the recording.
+            end = min(end, self._speech_end + self._speech_tail)
         self._logger.info("Recording stopped after %.2f seconds.", duration)
-        return audio
+        return self._buf[:end]
 
 
 class PushToTalkDaemon:
@@ -105,18 +270,43 @@ class PushToTalkDaemon:
         sample_rate: int,
         channels: int,
         max_seconds: int,
+        silence_seconds: Optional[float] = None,
+        silence_threshold: float = 0.01,
+        discard_silent: bool = False,
+        upload_format: str = "wav",
     ) -> None:
         self._client = client
         self._press_enter = press_enter
         self._model = model
         self._logger = logging.getLogger(self.__class__.__name__)
-        self._recorder = AudioRecorder(sample_rate, channels, max_seconds)
+        self._recorder = AudioRecorder(
+            sample_rate, channels, max_seconds, silence_seconds, silence_threshold, discard_silent
+        )
+        self._upload_spec = self._resolve_upload_format(upload_format, sample_rate, channels)
         self._ptt_key_code = self._resolve_keycode(ptt_key_name)
+        # PTT event value -> handler; autorepeat (value 2) has no entry.
+        self._key_handlers = {1: self._on_key_down, 0: self._on_key_up}
         self._devices = self._discover_devices()
-        self._fd_to_device: Dict[int, InputDevice] = {dev.fd: dev for dev in self._devices}
+        # Devices are registered once; the eventfd lets stop() wake a blocked select().
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_fd = os.eventfd(0, os.EFD_CLOEXEC | os.EFD_NONBLOCK)
+        self._selector.register(self._wakeup_fd, selectors.EVENT_READ, None)
+        for device in self._devices:
+            self._selector.register(device.fd, selectors.EVENT_READ, device)
+        # A single worker keeps transcripts typed in the order they were spoken.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="transcribe"
+        )
+        self._executor.submit(self._warm_up_connection)
+        # Key-up, the duration/silence checks and stop_recording() may race to finalize.
+        self._finalize_lock = threading.Lock()
         self._running = False
         if not self._devices:
-            self._logger.error("No input devices found. Ensure you have permission to read /dev/input/event*.")  # noqa: E501
+            self._logger.error(
+                "No input devices with %s found. Ensure you have permission to read /dev/input/event*, "  # noqa: E501
+                "or set PTT_KEY in config.py to a key your keyboard has.",
+                ptt_key_name,
+            )
         else:
             for device in self._devices:
                 self._logger.info("Listening on %s (%s)", device.path, device.name)
@@ -127,6 +317,34 @@ class PushToTalkDaemon:
         except KeyError as exc:
             raise ValueError(f"Unknown key name: {key_name}") from exc
 
+    def _resolve_upload_format(
+        self, upload_format: str, sample_rate: int, channels: int
+    ) -> Optional[Tuple[str, str, str, str]]:
+        """Check once that uploads can be compressed; None means send WAV."""
+        if upload_format == "wav":
+            return None
+        spec = _UPLOAD_FORMATS.get(upload_format)
+        if spec is None:
+            self._logger.warning("Unknown UPLOAD_FORMAT %r; uploading WAV.", upload_format)
+            return None
+        try:
+            import soundfile as sf
+        except (ImportError, OSError) as exc:
+            self._logger.warning("Cannot load soundfile for %s (%s); uploading WAV.", upload_format, exc)
+            return None
+        container, subtype, _, _ = spec
+        # libsndfile only rejects e.g. unsupported Opus sample rates at write time,
+        # so probe with a short silent clip.
+        probe = np.zeros((sample_rate // 10, channels), dtype=np.int16)
+        try:
+            sf.write(io.BytesIO(), probe, sample_rate, format=container, subtype=subtype)
+        except Exception as exc:
+            self._logger.warning(
+                "Cannot encode %s at %d Hz (%s); uploading WAV.", upload_format, sample_rate, exc
+            )
+            return None
+        return spec
+
     def _discover_devices(self) -> list[InputDevice]:
         devices = []
         for path in evdev.list_devices():
@@ -137,17 +355,12 @@ class PushToTalkDaemon:
                     "Skipping input device %s: %s", path, exc
                 )
                 continue
-            caps = device.capabilities().get(ecodes.EV_KEY, [])
-            key_codes: Iterable[int]
-            if isinstance(caps, dict):
-                key_codes = (code for codes in caps.values() for code in codes)
-            else:
-                key_codes = caps
-            if self._ptt_key_code in set(key_codes):
-                devices.append(device)
-                continue
-            if ecodes.EV_KEY in device.capabilities():
+            # absinfo=False skips the per-axis EVIOCGABS ioctls we have no use for.
+            caps = device.capabilities(verbose=False, absinfo=False)
+            if self._ptt_key_code in caps.get(ecodes.EV_KEY, ()):
                 devices.append(device)
+            else:
+                device.close()
         return devices
 
     def start_recording(self) -> None:
@@ -164,38 +377,47 @@ class PushToTalkDaemon:
         self._finalize_recording()
 
     def run(self) -> None:
-        if not self._fd_to_device:
+        if not self._devices:
+            self._cleanup()
             return
         self._running = True
         try:
             while self._running:
                 self._check_recording_duration()
-                ready, _, _ = select.select(self._fd_to_device.keys(), [], [], 0.1)
-                for fd in ready:
-                    device = self._fd_to_device.get(fd)
-                    if not device:
-                        continue
-                    try:
-                        for event in device.read():
-                            self._handle_event(event)
-                    except BlockingIOError:
+                for key, _ in self._selector.select(self._select_timeout()):
+                    device = key.data
+                    if device is None:
+                        os.eventfd_read(self._wakeup_fd)
                         continue
-                    except OSError as exc:
-                        self._logger.error("Device read error (%s): %s", device.path, exc)
+                    self._read_events(device)
         except KeyboardInterrupt:
             self._logger.info("Interrupted by user, exiting.")
         finally:
             self._cleanup()
 
-    def _handle_event(self, event) -> None:
-        if event.type != ecodes.EV_KEY:
-            return
-        if event.code != self._ptt_key_code:
-            return
-        if event.value == 1:  # key down
-            self._on_key_down()
-        elif event.value == 0:  # key up
-            self._on_key_up()
+    def _select_timeout(self) -> Optional[float]:
+        # Block until a key event, or until the recording hits its limit.
+        timeout = self._recorder.seconds_until_max_duration()
+        if timeout is not None and self._recorder.detects_silence:
+            timeout = min(timeout, _VAD_POLL_SECONDS)
+        return timeout
+
+    def _read_events(self, device: InputDevice) -> None:
+        # Locals keep the per-event filter to fast loads; nearly every event
+        # is some other key and never leaves this loop.
+        ev_key = ecodes.EV_KEY
+        ptt_key_code = self._ptt_key_code
+        key_handlers = self._key_handlers
+        try:
+            for event in device.read():
+                if event.code == ptt_key_code and event.type == ev_key:
+                    handler = key_handlers.get(event.value)
+                    if handler is not None:
+                        handler()
+        except BlockingIOError:
+            pass
+        except OSError as exc:
+            self._logger.error("Device read error (%s): %s", device.path, exc)
 
     def _on_key_down(self) -> None:
         if self._recorder.recording:
@@ -211,54 +433,74 @@ class PushToTalkDaemon:
         self._finalize_recording()
 
     def _check_recording_duration(self) -> None:
-        if self._recorder.recording and self._recorder.has_reached_max_duration():
+        if not self._recorder.recording:
+            return
+        if self._recorder.has_reached_max_duration():
             self._logger.info("Maximum recording duration reached.")
             self._finalize_recording()
+        elif self._recorder.has_trailing_silence():
+            self._logger.info("End of speech detected.")
+            self._finalize_recording()
 
     def _finalize_recording(self) -> None:
-        audio = self._recorder.stop()
-        if audio is None:
-            return
-        wav_path = self._write_wav(audio)
+        with self._finalize_lock:
+            if not self._recorder.recording:
+                return
+            audio = self._recorder.stop()
+            if audio is None:
+                return
+            # The recorder reuses its buffer for the next recording, so the worker
+            # gets a copy; encoding then happens off the event loop as well.
+            audio = audio.copy()
+        self._executor.submit(self._process_audio, audio)
+
+    def _warm_up_connection(self) -> None:
+        # Pay DNS, TCP and TLS setup now rather than on the first utterance.
+        # Fail fast: this runs on the transcription worker, ahead of real uploads.
+        try:
+            self._client.with_options(max_retries=0, timeout=5.0).models.list()
+        except Exception as exc:
+            self._logger.debug("Connection warm-up failed: %s", exc)
+
+    def _process_audio(self, audio: np.ndarray) -> None:
         try:
-            transcript = self._transcribe(wav_path)
+            transcript = self._transcribe(self._encode_audio(audio))
             if transcript:
                 self._type_text(transcript)
-        finally:
-            try:
-                wav_path.unlink(missing_ok=True)
-            except Exception as exc:
-                self._logger.warning("Failed to remove temporary audio file %s: %s", wav_path, exc)
-
-    def _write_wav(self, audio: np.ndarray) -> Path:
-        clipped = np.clip(audio, -1.0, 1.0)
-        pcm = np.int16(clipped * 32767)
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        temp_file.close()
-        path = Path(temp_file.name)
-        with path.open("wb") as handle:
-            self._write_wave_bytes(handle, pcm.tobytes())
-        self._logger.info("Saved audio to %s", path)
-        return path
-
-    def _write_wave_bytes(self, handle, frames: bytes) -> None:
-        import wave
-
-        with wave.open(handle, "wb") as wf:
-            wf.setnchannels(self._recorder.channels)
-            wf.setsampwidth(2)
-            wf.setframerate(self._recorder.sample_rate)
-            wf.writeframes(frames)
-
-    def _transcribe(self, wav_path: Path) -> str:
+        except Exception as exc:
+            self._logger.error("Failed to process recording: %s", exc, exc_info=True)
+
+    def _encode_audio(self, audio: np.ndarray) -> AudioUpload:
+        spec = self._upload_spec
+        if spec is None:
+            return self._encode_wav_bytes(audio)
+        import soundfile as sf
+
+        container, subtype, name, content_type = spec
+        buf = io.BytesIO()
+        try:
+            sf.write(buf, audio, self._recorder.sample_rate, format=container, subtype=subtype)
+        except Exception as exc:
+            self._logger.warning("Could not encode %s, sending WAV instead: %s", name, exc)
+            return self._encode_wav_bytes(audio)
+        buf.seek(0)
+        return name, buf, content_type
+
+    def _encode_wav_bytes(self, audio: np.ndarray) -> AudioUpload:
+        buf = io.BytesIO()
+        buf.write(_wav_header(audio.nbytes, self._recorder.sample_rate, self._recorder.channels))
+        buf.write(memoryview(audio))
+        buf.seek(0)
+        return "audio.wav", buf, "audio/wav"
+
+    def _transcribe(self, upload: AudioUpload) -> str:
         self._logger.info("Submitting audio to OpenAI for transcription.")
         try:
-            with wav_path.open("rb") as audio_file:
-                response = self._client.audio.transcriptions.create(
-                    model=self._model,
-                    file=audio_file,
-                    language="en",
-                )
+            response = self._client.audio.transcriptions.create(
+                model=self._model,
+                file=upload,
+                language="en",
+            )
         except Exception as exc:
             self._logger.error("Transcription request failed: %s", exc, exc_info=True)
             return ""
@@ -273,34 +515,46 @@ class PushToTalkDaemon:
         return text.strip()
 
     def _type_text(self, text: str) -> None:
+        # One chained xdotool invocation instead of a fork/exec per step.
+        cmd = ["xdotool"]
         keysym = getattr(config, "PTT_KEYSYM", None)
         if keysym:
-            try:
-                subprocess.run(
-                    ["xdotool", "keyup", "--clearmodifiers", keysym],
-                    check=True,
-                )
-            except (FileNotFoundError, subprocess.CalledProcessError) as exc:
-                self._logger.warning("Failed to send keyup for %s: %s", keysym, exc)
-        cmd = ["xdotool", "type", "--delay", "0", "--clearmodifiers", text]
+            cmd += ["keyup", "--clearmodifiers", keysym]
+        # `type` consumes every remaining argument, so Enter is sent as a
+        # trailing newline (typed as Return) rather than a chained `key`.
+        if self._press_enter:
+            text += "\n"
+        cmd += ["type", "--delay", "0", "--clearmodifiers", "--", text]
         try:
             subprocess.run(cmd, check=True)
-            self._logger.info("Typed transcription into focused window.")
-            if self._press_enter:
-                subprocess.run(["xdotool", "key", "--clearmodifiers", "Return"], check=True)
-                self._logger.info("Sent Enter key as configured.")
         except (FileNotFoundError, subprocess.CalledProcessError) as exc:
             self._logger.error("Failed to send text via xdotool: %s", exc, exc_info=True)
+            return
+        self._logger.info("Typed transcription into focused window.")
+        if self._press_enter:
+            self._logger.info("Sent Enter key as configured.")
 
     def _cleanup(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._selector.close()
         for device in self._devices:
             try:
                 device.close()
             except Exception:
                 pass
+        try:
+            os.close(self._wakeup_fd)
+        except OSError:
+            pass
+        # Closed descriptor numbers may be reused; make a late stop() a no-op.
+        self._wakeup_fd = -1
 
     def stop(self) -> None:
         self._running = False
+        try:
+            os.eventfd_write(self._wakeup_fd, 1)
+        except (OSError, ValueError):
+            pass
 
 
 def main() -> int:
@@ -325,7 +579,7 @@ def main() -> int:
         logging.getLogger("main").error("OPENAI_API_KEY is not set. Check your .env file.")
         return 1
 
-    client = OpenAI(api_key=api_key)
+    client = create_openai_client(api_key)
     daemon = PushToTalkDaemon(
         client=client,
         ptt_key_name=config.PTT_KEY,
@@ -334,6 +588,10 @@ def main() -> int:
         sample_rate=config.AUDIO_SAMPLE_RATE,
         channels=config.AUDIO_CHANNELS,
         max_seconds=config.MAX_RECORD_SECONDS,
+        silence_seconds=config.SILENCE_STOP_SECONDS,
+        silence_threshold=config.SILENCE_THRESHOLD,
+        discard_silent=config.DISCARD_SILENT_RECORDINGS,
+        upload_format=config.UPLOAD_FORMAT,
     )
 
     daemon.run()
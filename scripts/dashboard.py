@@ -7,6 +7,7 @@ OPENAI_API_KEY stored in the project's .env file.
 
 from __future__ import annotations
 
+import os
 import queue
 import sys
 import threading
@@ -20,13 +21,16 @@ import evdev
 from openai import OpenAI
 
 import config
-from main import PushToTalkDaemon
+from main import PushToTalkDaemon, create_openai_client
 
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 VENV_PYTHON = PROJECT_ROOT / ".venv" / "bin" / "python"
 SCRIPT_ENTRYPOINT = PROJECT_ROOT / "main.py"
 ENV_PATH = PROJECT_ROOT / ".env"
+LOG_MAX_LINES = 2000
+LOG_POLL_MS = 100
+LOG_IDLE_POLL_MS = 200
 
 
 class DashboardApp:
@@ -34,6 +38,11 @@ class DashboardApp:
         self.root = root
         self.daemon: Optional[PushToTalkDaemon] = None
         self.daemon_thread: Optional[threading.Thread] = None
+        self._client: Optional[OpenAI] = None
+        self._client_key: Optional[str] = None
+        # Daemon threads started with the current client; a stopped daemon can
+        # still be finishing a transcription on it.
+        self._client_threads: list[threading.Thread] = []
         self.log_queue: queue.Queue[str] = queue.Queue()
         self.status_var = tk.StringVar(value="Status: stopped")
         self.api_key_var = tk.StringVar(value=self._load_api_key())
@@ -92,7 +101,7 @@ class DashboardApp:
         self.stop_button.pack(fill="x", pady=(6, 0))
         self.stop_button.configure(state="disabled")
 
-        self.root.after(100, self._drain_log_queue)
+        self.root.after(LOG_POLL_MS, self._drain_log_queue)
 
     def start(self) -> None:
         if self.daemon and self.daemon_thread and self.daemon_thread.is_alive():
@@ -113,19 +122,23 @@ class DashboardApp:
         self._clear_log()
         self._redirect_stdout()
 
-        client = OpenAI(api_key=key)
         self.daemon = PushToTalkDaemon(
-            client=client,
+            client=self._get_client(key),
             ptt_key_name=config.PTT_KEY,
             press_enter=config.PRESS_ENTER,
             model=config.MODEL,
             sample_rate=config.AUDIO_SAMPLE_RATE,
             channels=config.AUDIO_CHANNELS,
             max_seconds=config.MAX_RECORD_SECONDS,
+            silence_seconds=config.SILENCE_STOP_SECONDS,
+            silence_threshold=config.SILENCE_THRESHOLD,
+            discard_silent=config.DISCARD_SILENT_RECORDINGS,
+            upload_format=config.UPLOAD_FORMAT,
         )
 
         self.daemon_thread = threading.Thread(target=self.daemon.run, daemon=True)
         self.daemon_thread.start()
+        self._client_threads.append(self.daemon_thread)
 
         self.status_var.set("Status: running")
         self.start_button.configure(state="disabled")
@@ -153,6 +166,7 @@ class DashboardApp:
 
     def on_close(self) -> None:
         self.stop()
+        self._retire_client()
         self.root.destroy()
 
     def save_api_key(self) -> None:
@@ -170,6 +184,34 @@ class DashboardApp:
     def toggle_api_visibility(self) -> None:
         self.api_entry.configure(show="" if self.show_api_var.get() else "*")
 
+    def _get_client(self, key: str) -> OpenAI:
+        # Reuse the client across Stop/Start so its pooled connection stays warm.
+        if self._client is None or self._client_key != key:
+            self._retire_client()
+            self._client = create_openai_client(key)
+            self._client_key = key
+        return self._client
+
+    def _retire_client(self) -> None:
+        client = self._client
+        if client is None:
+            return
+        threads = [thread for thread in self._client_threads if thread.is_alive()]
+        self._client = None
+        self._client_key = None
+        self._client_threads = []
+        if not threads:
+            client.close()
+            return
+
+        # Close only once every daemon using the client has finished its cleanup.
+        def close_when_idle() -> None:
+            for thread in threads:
+                thread.join()
+            client.close()
+
+        threading.Thread(target=close_when_idle, daemon=True).start()
+
     def _redirect_stdout(self) -> None:
         sys.stdout = self
 
@@ -183,18 +225,17 @@ class DashboardApp:
         pass
 
     def _drain_log_queue(self) -> None:
-        updated = False
+        chunks = []
         while True:
             try:
-                line = self.log_queue.get_nowait()
+                chunks.append(self.log_queue.get_nowait())
             except queue.Empty:
                 break
-            else:
-                self._append_log(line)
-                updated = True
-        if updated:
+        if chunks:
+            self._append_log("".join(chunks))
             self.log_text.see("end")
-        self.root.after(100, self._drain_log_queue)
+        # Poll less often while the daemon is quiet.
+        self.root.after(LOG_POLL_MS if chunks else LOG_IDLE_POLL_MS, self._drain_log_queue)
 
     def _clear_log(self) -> None:
         self.log_text.configure(state="normal")
@@ -204,6 +245,9 @@ class DashboardApp:
     def _append_log(self, text: str) -> None:
         self.log_text.configure(state="normal")
         self.log_text.insert("end", text)
+        lines = int(self.log_text.index("end-1c").split(".")[0])
+        if lines > LOG_MAX_LINES:
+            self.log_text.delete("1.0", f"{lines - LOG_MAX_LINES + 1}.0")
         self.log_text.configure(state="disabled")
 
     def _reset_buttons(self) -> None:
@@ -237,8 +281,10 @@ class DashboardApp:
 
         if ENV_PATH.exists():
             existing = ENV_PATH.read_text(encoding="utf-8").splitlines()
+            mode = ENV_PATH.stat().st_mode & 0o777
         else:
             existing = []
+            mode = 0o600
 
         for line in existing:
             if line.startswith("OPENAI_API_KEY="):
@@ -250,11 +296,22 @@ class DashboardApp:
         if not found:
             lines.append(f"OPENAI_API_KEY={key}")
 
-        text = "\n".join(lines)
-        if text and not text.endswith("\n"):
-            text += "\n"
+        text = "\n".join(lines) + "\n"
 
-        ENV_PATH.write_text(text, encoding="utf-8")
+        # Write beside the real file and rename over it so a crash never
+        # leaves a truncated .env behind. The temp file gets its final mode
+        # before the key is written, so it is never more readable than .env.
+        tmp_path = ENV_PATH.with_name(ENV_PATH.name + ".tmp")
+        tmp_path.unlink(missing_ok=True)  # stale leftover from an interrupted save
+        try:
+            fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, mode)
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                os.fchmod(handle.fileno(), mode)  # os.open's mode is masked by umask
+                handle.write(text)
+            os.replace(tmp_path, ENV_PATH)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
 
 
 def main() -> None: